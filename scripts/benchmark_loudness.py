@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+import os
+import sys
+import json
+import time
+import shutil
+import subprocess
+
+import loudness
+from compile_video import (
+    INPUT_PATHS_JSON, ENCODE_VIDEO_CODEC, ENCODE_VIDEO_PRESET, ENCODE_VIDEO_CRF,
+    ENCODE_AUDIO_CODEC, ENCODE_AUDIO_BITRATE, ENCODE_AUDIO_RATE, ENCODE_AUDIO_CHANNELS
+)
+
+# Nombre de clips mesurés et dossier des sorties du benchmark (supprimé à la fin)
+BENCH_CLIPS = 3
+BENCH_ROUNDS = 2  # chaque méthode est chronométrée BENCH_ROUNDS fois par clip
+BENCH_DIR = os.path.join("data", "bench_loudness")
+
+def encode_cmd(input_path, output_path, audio_filter_args):
+    return [
+        "ffmpeg", "-y", "-v", "error",
+        "-i", input_path,
+        *audio_filter_args,
+        "-c:v", ENCODE_VIDEO_CODEC,
+        "-preset", ENCODE_VIDEO_PRESET,
+        "-crf", ENCODE_VIDEO_CRF,
+        "-pix_fmt", "yuv420p",
+        "-c:a", ENCODE_AUDIO_CODEC,
+        "-b:a", ENCODE_AUDIO_BITRATE,
+        "-ar", ENCODE_AUDIO_RATE,
+        "-ac", ENCODE_AUDIO_CHANNELS,
+        "-f", "mpegts",
+        output_path
+    ]
+
+# Chaque méthode produit la même sortie normalisée à partir du même clip :
+# encodage du clip traité, analyse de sonie, puis encodage de préparation normalisé.
+# Seuls la portée de l'analyse (fichier complet ou audio seul) et son ordonnancement changent.
+
+def full_decode_analysis(input_path):
+    """Passage d'analyse loudnorm classique : décode tout le fichier, vidéo comprise (pas de -vn)."""
+    analysis = subprocess.run([
+        "ffmpeg", "-hide_banner", "-nostats",
+        "-i", input_path,
+        "-af", f"{loudness.loudnorm_targets()}:print_format=json",
+        "-f", "null", "-"
+    ], capture_output=True, text=True, check=True)
+    m = loudness.parse_loudnorm_report(analysis.stderr)
+    return {
+        "integrated_lufs": float(m["input_i"]),
+        "true_peak_dbtp": float(m["input_tp"]),
+        "lra": float(m["input_lra"]),
+        "threshold": float(m["input_thresh"]),
+        "target_offset": float(m["target_offset"]),
+    }
+
+def normalized_encode(processed_path, output_path, measurement):
+    audio_filter = loudness.loudnorm_filter(measurement)
+    subprocess.run(encode_cmd(processed_path, output_path, ["-af", audio_filter] if audio_filter else []),
+                   check=True, capture_output=True, text=True)
+
+def two_pass_loudnorm(input_path, processed_path, output_path):
+    """Méthode naïve : loudnorm en deux passes, analyse complète (audio + vidéo) après l'encodage."""
+    start = time.monotonic()
+    subprocess.run(encode_cmd(input_path, processed_path, []), check=True, capture_output=True, text=True)
+    normalized_encode(processed_path, output_path, full_decode_analysis(input_path))
+    return time.monotonic() - start
+
+def sequential_loudnorm(input_path, processed_path, output_path):
+    """Analyse sur l'audio seul, mais qui attend la fin de l'encodage du clip traité."""
+    start = time.monotonic()
+    subprocess.run(encode_cmd(input_path, processed_path, []), check=True, capture_output=True, text=True)
+    normalized_encode(processed_path, output_path, loudness.measure_loudness(input_path))
+    return time.monotonic() - start
+
+def concurrent_loudnorm(input_path, processed_path, output_path):
+    """Méthode du pipeline : l'analyse (audio seul) tourne pendant l'encodage du clip traité."""
+    start = time.monotonic()
+    measurement = loudness.measure_async(input_path)
+    subprocess.run(encode_cmd(input_path, processed_path, []), check=True, capture_output=True, text=True)
+    normalized_encode(processed_path, output_path, measurement)
+    return time.monotonic() - start
+
+METHODS = [
+    ("two_pass", "loudnorm 2 passes (analyse complète)", two_pass_loudnorm),
+    ("sequential", "analyse audio seule, séquentielle", sequential_loudnorm),
+    ("concurrent", "analyse audio seule, concurrente (pipeline)", concurrent_loudnorm),
+]
+
+def warm_up(path):
+    """Lecture complète non chronométrée : aucune méthode ne paie le cache disque froid."""
+    with open(path, "rb") as f:
+        while f.read(1024 * 1024):
+            pass
+
+def benchmark_loudness():
+    if not os.path.exists(INPUT_PATHS_JSON):
+        print(f"❌ {INPUT_PATHS_JSON} introuvable : lancez download_clips.py avant le benchmark.")
+        sys.exit(1)
+    with open(INPUT_PATHS_JSON, "r", encoding="utf-8") as f:
+        clips = [c for c in json.load(f) if c.get("path") and os.path.exists(c["path"])][:BENCH_CLIPS]
+    if not clips:
+        print("⚠️ Aucun clip disponible pour le benchmark.")
+        sys.exit(0)
+
+    os.makedirs(BENCH_DIR, exist_ok=True)
+    print("⏱️ Chaque temps couvre : encodage du clip traité + analyse de sonie "
+          "+ encodage de préparation normalisé (loudnorm mesuré, même sortie pour toutes les méthodes).")
+    print(f"   {BENCH_ROUNDS} tour(s) par clip, ordre des méthodes alterné, cache disque préchauffé.")
+    totals = {key: 0.0 for key, _, _ in METHODS}
+    try:
+        for idx, clip in enumerate(clips):
+            clip_id = clip.get("id", f"clip{idx}")
+            warm_up(clip["path"])
+            times = {key: 0.0 for key, _, _ in METHODS}
+            for round_idx in range(BENCH_ROUNDS):
+                shift = (idx + round_idx) % len(METHODS)
+                for key, _, method in METHODS[shift:] + METHODS[:shift]:
+                    processed = os.path.join(BENCH_DIR, f"{clip_id}_{key}_processed.ts")
+                    out = os.path.join(BENCH_DIR, f"{clip_id}_{key}.ts")
+                    times[key] += method(clip["path"], processed, out)
+            print(f"  {clip_id}: " + ", ".join(f"{key} {times[key] / BENCH_ROUNDS:.1f}s" for key, _, _ in METHODS))
+            for key in totals:
+                totals[key] += times[key] / BENCH_ROUNDS
+        print("📊 Total (moyenne par tour) :")
+        for key, label, _ in METHODS:
+            print(f"   {label:<45} {totals[key]:7.1f}s  (x{totals['two_pass'] / totals[key]:.2f} vs 2 passes)")
+    except (subprocess.CalledProcessError, ValueError, KeyError) as e:
+        print("❌ Erreur pendant le benchmark :", e)
+        sys.exit(1)
+    finally:
+        shutil.rmtree(BENCH_DIR, ignore_errors=True)
+
+if __name__ == "__main__":
+    benchmark_loudness()
@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+import os
+import sys
+import time
+import shutil
+import subprocess
+
+from compile_video import CLIPS_LIST_TXT, OUTPUT_VIDEO_PATH, RENDITIONS, build_concat_cmd
+
+# Dossier des sorties du benchmark (supprimé à la fin)
+BENCH_DIR = os.path.join("data", "bench_renditions")
+
+def timed_run(cmd):
+    start = time.monotonic()
+    subprocess.run(cmd, check=True, capture_output=True, text=True)
+    return time.monotonic() - start
+
+def with_bench_path(rendition, suffix):
+    r = dict(rendition)
+    r["path"] = os.path.join(BENCH_DIR, f"{suffix}_{os.path.basename(rendition['path'])}")
+    return r
+
+def benchmark_renditions():
+    """
+    Compare la production des déclinaisons en une seule commande (un décodage + split)
+    au rendu de chaque sortie séparément (un décodage par sortie).
+    Nécessite la liste de concat de compile_video.py (data/clips_list.txt et concat_prep).
+    """
+    if not os.path.exists(CLIPS_LIST_TXT):
+        print(f"❌ {CLIPS_LIST_TXT} introuvable : lancez compile_video.py (hors mode budget disque et STREAM_INTERMEDIATES) avant le benchmark.")
+        sys.exit(1)
+
+    os.makedirs(BENCH_DIR, exist_ok=True)
+    master = os.path.join(BENCH_DIR, os.path.basename(OUTPUT_VIDEO_PATH))
+    try:
+        print(f"⏱️ Rendu combiné (master + {', '.join(RENDITIONS)}) depuis un seul décodage...")
+        combined = [with_bench_path(r, "split") for r in RENDITIONS.values()]
+        t_split = timed_run(build_concat_cmd(CLIPS_LIST_TXT, master, combined))
+        print(f"  {t_split:.1f}s")
+
+        print("⏱️ Rendu séparé (une commande par sortie)...")
+        t_separate = timed_run(build_concat_cmd(CLIPS_LIST_TXT, master, []))
+        for name, rendition in RENDITIONS.items():
+            elapsed = timed_run(build_concat_cmd(CLIPS_LIST_TXT, None, [with_bench_path(rendition, "separate")]))
+            print(f"  {name:<8} {elapsed:.1f}s")
+            t_separate += elapsed
+        print(f"  total {t_separate:.1f}s")
+
+        print(f"📊 Un seul décodage : {t_split:.1f}s vs rendus séparés : {t_separate:.1f}s "
+              f"(x{t_separate / t_split:.2f})")
+    except subprocess.CalledProcessError as e:
+        print("❌ Erreur FFmpeg :", e)
+        if e.stderr: print(f"    STDERR: {e.stderr}")
+        sys.exit(1)
+    finally:
+        shutil.rmtree(BENCH_DIR, ignore_errors=True)
+
+if __name__ == "__main__":
+    benchmark_renditions()
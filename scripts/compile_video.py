@@ -4,6 +4,11 @@ import os
 import json
 import sys
 import shutil
+import threading
+import disk_budget
+import loudness
+from generate_metadata import build_chapter_lines
+from process_supervisor import MAX_STALL_RETRIES, ProcessStalled, clip_deadline, run_supervised
 
 # --- Chemins des fichiers ---
 INPUT_PATHS_JSON = os.path.join("data", "downloaded_clip_paths.json")
@@ -16,7 +21,11 @@ INTRO_PATH = os.path.join(ASSETS_DIR, "intro.mp4")
 OUTRO_PATH = os.path.join(ASSETS_DIR, "outro.mp4")
 
 # Dossier temporaire pour les fichiers préparés (timestamps régénérés, codec unifié)
+# Les intermédiaires sont en MPEG-TS : pas de réécriture faststart, seule la sortie finale la paie
 PREP_DIR = os.path.join("data", "concat_prep")
+# STREAM_INTERMEDIATES=1 : les fichiers préparés passent par des FIFO directement
+# dans le muxer final au lieu d'être écrits sur disque (POSIX uniquement)
+STREAM_INTERMEDIATES = os.getenv("STREAM_INTERMEDIATES", "0") == "1" and hasattr(os, "mkfifo")
 
 MAX_TOTAL_CLIPS = 35
 
@@ -29,33 +38,183 @@ ENCODE_AUDIO_BITRATE = "192k"
 ENCODE_AUDIO_RATE = "48000"
 ENCODE_AUDIO_CHANNELS = "2"
 
-def run(cmd, **kwargs):
+# --- Aperçu basse résolution (PROXY_PREVIEW=1) ---
+# Même montage (clips, textes incrustés, intro/outro) rendu en quelques pourcents du temps,
+# pour valider l'ordre et les chapitres avant de lancer le rendu master
+PROXY_PREVIEW = os.getenv("PROXY_PREVIEW", "0") == "1"
+PROXY_VIDEO_PATH = os.path.join("output", "preview_proxy.mp4")
+PROXY_PREP_DIR = os.path.join("data", "concat_prep_proxy")
+PROXY_CLIPS_LIST_TXT = os.path.join("data", "clips_list_proxy.txt")
+PROXY_VIDEO_FILTER = "scale=640:360,setsar=1"
+PROXY_VIDEO_PRESET = "ultrafast"
+PROXY_VIDEO_CRF = "30"
+PROXY_AUDIO_BITRATE = "96k"
+
+# --- Déclinaisons optionnelles, produites à partir d'un seul décodage (filtre split) ---
+# ex: EXTRA_RENDITIONS="720p,shorts" ; le master 1080p reste une copie sans réencodage
+EXTRA_RENDITIONS = [r.strip() for r in os.getenv("EXTRA_RENDITIONS", "").split(",") if r.strip()]
+RENDITIONS = {
+    "720p": {
+        "path": os.path.join("output", "compiled_video_720p.mp4"),
+        "filter": "scale=1280:720,setsar=1",
+        "video_args": ["-c:v", "libx264", "-preset", "veryfast", "-crf", "21",
+                       "-maxrate", "5M", "-bufsize", "10M"],
+        "audio_args": ["-c:a", "aac", "-b:a", "128k"],
+    },
+    "shorts": {
+        # Recadrage central 9:16 pour les Shorts
+        "path": os.path.join("output", "compiled_video_shorts.mp4"),
+        "filter": "crop=trunc(ih*9/16/2)*2:ih,scale=1080:1920,setsar=1",
+        "video_args": ["-c:v", "libx264", "-preset", "veryfast", "-crf", "20",
+                       "-profile:v", "high", "-level", "4.2"],
+        "audio_args": ["-c:a", "aac", "-b:a", "160k"],
+    },
+}
+
+def run(cmd, deadline=None, retries=MAX_STALL_RETRIES):
     print("▶", " ".join(cmd))
-    subprocess.run(cmd, check=True, **kwargs)
+    run_supervised(cmd, deadline=deadline, retries=retries, echo=True)
 
-def prepare_file(input_path, output_path):
-    """Réencode / remuxe le fichier pour standardiser codecs et timestamps."""
+def prepare_file(input_path, output_path, retries=MAX_STALL_RETRIES, proxy=False, audio_filter=None):
+    """
+    Réencode le fichier en MPEG-TS pour standardiser codecs et timestamps (basse résolution si proxy).
+    audio_filter : filtre loudnorm déjà mesuré (normalisation de sonie en un seul passage).
+    """
     os.makedirs(os.path.dirname(output_path), exist_ok=True)
     cmd = [
         "ffmpeg", "-y",
         "-i", input_path,
         "-fflags", "+genpts",            # régénère les pts si besoin
         "-avoid_negative_ts", "make_zero",
+        *(["-vf", PROXY_VIDEO_FILTER] if proxy else []),
+        *(["-af", audio_filter] if audio_filter else []),
         "-c:v", ENCODE_VIDEO_CODEC,
-        "-preset", ENCODE_VIDEO_PRESET,
-        "-crf", ENCODE_VIDEO_CRF,
+        "-preset", PROXY_VIDEO_PRESET if proxy else ENCODE_VIDEO_PRESET,
+        "-crf", PROXY_VIDEO_CRF if proxy else ENCODE_VIDEO_CRF,
         "-pix_fmt", "yuv420p",
         "-c:a", ENCODE_AUDIO_CODEC,
-        "-b:a", ENCODE_AUDIO_BITRATE,
+        "-b:a", PROXY_AUDIO_BITRATE if proxy else ENCODE_AUDIO_BITRATE,
         "-ar", ENCODE_AUDIO_RATE,
         "-ac", ENCODE_AUDIO_CHANNELS,
-        "-movflags", "+faststart",       # meilleur pour la lecture progressive
+        "-f", "mpegts",                  # conteneur streamable, pas de second passage faststart
         output_path
     ]
-    run(cmd)
+    run(cmd, deadline=clip_deadline(), retries=retries)
+
+def prepare_sources(sources, prep_paths, retries=MAX_STALL_RETRIES, proxy=False, stop=None):
+    """Prépare les sources dans l'ordre ; s'arrête avant le fichier suivant si stop est levé."""
+    for (src, _, label, evictable, measurement), dst in zip(sources, prep_paths):
+        if stop is not None and stop.is_set():
+            return
+        print(f"🔧 Préparation {label}")
+        measurement = loudness.resolve(measurement)
+        audio_filter = loudness.loudnorm_filter(measurement)
+        if audio_filter:
+            print(f"  🔊 Normalisation : {measurement['integrated_lufs']:.1f} → {loudness.TARGET_LUFS:.1f} LUFS")
+        prepare_file(src, dst, retries=retries, proxy=proxy, audio_filter=audio_filter)
+        disk_budget.record_usage("compile")
+
+def release_fifos(fifo_paths, stop):
+    """
+    Ouvre puis referme en écriture chaque FIFO jusqu'à ce que stop soit levé : le concat
+    bloqué dans open() reçoit une fin de flux au lieu d'attendre le watchdog.
+    """
+    while not stop.is_set():
+        for p in fifo_paths:
+            try:
+                os.close(os.open(p, os.O_WRONLY | os.O_NONBLOCK))
+            except OSError:
+                pass  # pas (encore) de lecteur sur cette FIFO
+        stop.wait(0.2)
+
+def stream_concat(sources, prep_paths, concat_cmd, proxy=False):
+    """
+    Remplace chaque fichier préparé par une FIFO : les préparations s'exécutent une par une
+    dans un thread et alimentent directement le concat demuxer, qui lit les FIFO dans l'ordre.
+    Pas de relance après blocage : un flux déjà consommé ne peut pas être rejoué.
+    Si une préparation échoue, le concat est débloqué aussitôt et c'est cette erreur qui est levée ;
+    si le concat échoue d'abord, les préparations restantes sont arrêtées et son erreur est levée.
+    """
+    for p in prep_paths:
+        os.mkfifo(p)
+
+    errors = []
+    concat_done = threading.Event()
+    def producer():
+        try:
+            prepare_sources(sources, prep_paths, retries=0, proxy=proxy, stop=concat_done)
+        except Exception as e:
+            failed_first = not concat_done.is_set()
+            errors.append((e, failed_first))
+            if failed_first:
+                print(f"❌ Préparation interrompue, arrêt du concat : {e}")
+                release_fifos(prep_paths, concat_done)
+
+    thread = threading.Thread(target=producer, daemon=True)
+    thread.start()
+    concat_error = None
+    try:
+        run(concat_cmd, retries=0)
+    except Exception as e:
+        concat_error = e
+    finally:
+        concat_done.set()
+        # Tant que le producteur tourne, débloquer toute préparation en attente d'un lecteur :
+        # le muxer est arrêté, elle échoue aussitôt (EPIPE) au lieu d'attendre le watchdog
+        while thread.is_alive():
+            for p in prep_paths:
+                try:
+                    os.close(os.open(p, os.O_RDONLY | os.O_NONBLOCK))
+                except OSError:
+                    pass
+            thread.join(timeout=0.2)
+    # Une préparation en échec avant la fin du concat est la cause réelle :
+    # l'erreur du concat n'en est alors que la conséquence
+    if errors and errors[0][1]:
+        raise errors[0][0] from concat_error
+    if concat_error:
+        raise concat_error
+    if errors:
+        raise errors[0][0]
 
-def compile_video():
-    print("🎬 Démarrage compilation (préparation + concat stable)...")
+def build_concat_cmd(list_path, master_path, renditions):
+    """
+    Commande de concaténation finale : le master est copié tel quel, et chaque
+    déclinaison est filtrée / encodée depuis un unique décodage via split.
+    """
+    cmd = ["ffmpeg", "-y", "-f", "concat", "-safe", "0", "-i", list_path]
+    if renditions:
+        split = f"[0:v]split={len(renditions)}" + "".join(f"[s{i}]" for i in range(len(renditions)))
+        branches = [f"[s{i}]{r['filter']}[v{i}]" for i, r in enumerate(renditions)]
+        cmd += ["-filter_complex", ";".join([split] + branches)]
+    if master_path:
+        cmd += [
+            "-map", "0:v", "-map", "0:a",
+            "-c", "copy",      # copy parce qu'on a déjà standardisé codecs & metadata
+            "-bsf:a", "aac_adtstoasc",  # AAC ADTS (MPEG-TS) -> MP4
+            "-movflags", "+faststart",  # seule la sortie finale est lue en progressif
+            master_path
+        ]
+    for i, r in enumerate(renditions):
+        cmd += ["-map", f"[v{i}]", "-map", "0:a"]
+        cmd += r["video_args"] + ["-pix_fmt", "yuv420p"] + r["audio_args"]
+        cmd += ["-movflags", "+faststart", r["path"]]
+    return cmd
+
+def get_extra_renditions():
+    unknown = [name for name in EXTRA_RENDITIONS if name not in RENDITIONS]
+    if unknown:
+        print(f"⚠️ Déclinaisons inconnues ignorées : {', '.join(unknown)}")
+    return [RENDITIONS[name] for name in EXTRA_RENDITIONS if name in RENDITIONS]
+
+def compile_video(proxy=PROXY_PREVIEW):
+    if proxy:
+        print("🎬 Démarrage de l'aperçu basse résolution (même montage que le master)...")
+    else:
+        print("🎬 Démarrage compilation (préparation + concat stable)...")
+    prep_dir = PROXY_PREP_DIR if proxy else PREP_DIR
+    clips_list_txt = PROXY_CLIPS_LIST_TXT if proxy else CLIPS_LIST_TXT
+    output_video_path = PROXY_VIDEO_PATH if proxy else OUTPUT_VIDEO_PATH
 
     # Vérifications basiques
     if not os.path.exists(INTRO_PATH):
@@ -82,68 +241,83 @@ def compile_video():
         print("⚠️ Aucun clip valide.")
         sys.exit(0)
 
-    # Préparer dossier temporaire
-    if os.path.exists(PREP_DIR):
-        shutil.rmtree(PREP_DIR)
-    os.makedirs(PREP_DIR, exist_ok=True)
+    # Mode budget disque : vérifier le pic estimé avant d'encoder quoi que ce soit
+    if not proxy:
+        disk_budget.check_budget([c["duration"] for c in final_clips])
+
+    # Préparer dossier temporaire (fichiers .ts, ou FIFO en mode flux)
+    if os.path.exists(prep_dir):
+        shutil.rmtree(prep_dir)
+    os.makedirs(prep_dir, exist_ok=True)
 
-    prep_paths = []
+    # Sources dans l'ordre du montage :
+    # (fichier, nom préparé, libellé, supprimable après usage, mesure de sonie)
+    # Les clips ont été mesurés par download_clips.py ; l'intro et l'outro sont mesurés
+    # ici, en arrière-plan pendant la préparation des premiers fichiers
+    sources = [(INTRO_PATH, "000_intro_prep.ts", "de l'intro...", False, loudness.measure_async(INTRO_PATH))]
+    outro_measurement = loudness.measure_async(OUTRO_PATH)
+    for idx, clip in enumerate(final_clips, start=1):
+        src = clip["path"]
+        # normaliser le nom (prefix pour garder l'ordre)
+        stem = os.path.splitext(os.path.basename(src))[0]
+        sources.append((src, f"{idx:03d}_{stem}.ts", f"clip {idx}/{len(final_clips)} : {src}", True, clip.get("loudness")))
+    sources.append((OUTRO_PATH, "999_outro_prep.ts", "de l'outro...", False, outro_measurement))
+    prep_paths = [os.path.join(prep_dir, name) for _, name, _, _, _ in sources]
 
     try:
-        # 1) Préparer l'intro et l'outro (on standardise aussi)
-        intro_prep = os.path.join(PREP_DIR, "000_intro_prep.mp4")
-        outro_prep = os.path.join(PREP_DIR, "999_outro_prep.mp4")
-        print("🔧 Préparation de l'intro...")
-        prepare_file(INTRO_PATH, intro_prep)
-        print("🔧 Préparation de l'outro...")
-        prepare_file(OUTRO_PATH, outro_prep)
-        prep_paths.append(intro_prep)
-
-        # 2) Préparer chaque clip (réencodage standardisé)
-        for idx, clip in enumerate(final_clips, start=1):
-            src = clip["path"]
-            # normaliser le nom (prefix pour garder l'ordre)
-            dst = os.path.join(PREP_DIR, f"{idx:03d}_{os.path.basename(src)}")
-            print(f"🔧 Préparation clip {idx}/{len(final_clips)} : {src}")
-            prepare_file(src, dst)
-            prep_paths.append(dst)
-
-        prep_paths.append(outro_prep)
-
-        # 3) Écrire la liste pour le concat demuxer
-        os.makedirs(os.path.dirname(CLIPS_LIST_TXT), exist_ok=True)
-        with open(CLIPS_LIST_TXT, "w", encoding="utf-8") as f:
+        # 1) Écrire la liste pour le concat demuxer
+        os.makedirs(os.path.dirname(clips_list_txt), exist_ok=True)
+        with open(clips_list_txt, "w", encoding="utf-8") as f:
             for p in prep_paths:
                 f.write(f"file '{os.path.abspath(p)}'\n")
 
-        # 4) Concaténation finale en copy (les fichiers ont déjà le même codec)
-        print("🔗 Concaténation finale (mode fast) ...")
-        os.makedirs(os.path.dirname(OUTPUT_VIDEO_PATH), exist_ok=True)
-        concat_cmd = [
-            "ffmpeg",
-            "-f", "concat",
-            "-safe", "0",
-            "-i", CLIPS_LIST_TXT,
-            "-c", "copy",      # copy parce qu'on a déjà standardisé codecs & metadata
-            "-movflags", "+faststart",
-            "-y",
-            OUTPUT_VIDEO_PATH
-        ]
-        run(concat_cmd)
+        # 2) Concaténation finale en copy (les fichiers ont déjà le même codec),
+        #    plus les déclinaisons éventuelles dans la même commande
+        renditions = [] if proxy else get_extra_renditions()
+        label = f" + {len(renditions)} déclinaison(s)" if renditions else ""
+        os.makedirs(os.path.dirname(output_video_path), exist_ok=True)
+        concat_cmd = build_concat_cmd(clips_list_txt, output_video_path, renditions)
+
+        if STREAM_INTERMEDIATES:
+            # Préparation et concaténation simultanées, via des FIFO au lieu de fichiers
+            print(f"🔗 Concaténation en flux (mode pipe{label}) ...")
+            stream_concat(sources, prep_paths, concat_cmd, proxy=proxy)
+        else:
+            # Préparer chaque fichier (réencodage standardisé), puis concaténer
+            prepare_sources(sources, prep_paths, proxy=proxy)
+            print(f"🔗 Concaténation finale (mode fast{label}) ...")
+            run(concat_cmd)
+        disk_budget.record_usage("compile")
+
+        # Mode budget disque : les clips traités et les préparés ne sont supprimés qu'une fois
+        # le concat réussi, pour qu'une relance puisse reprendre sans re-télécharger
+        # (l'aperçu laisse les clips traités au master)
+        if not proxy:
+            for src, _, _, evictable, _ in sources:
+                if evictable:
+                    disk_budget.evict(src)
+        disk_budget.evict(prep_dir)
+        disk_budget.evict(clips_list_txt)
 
-        print(f"✅ Compilation terminée : {OUTPUT_VIDEO_PATH}")
+        print(f"✅ Compilation terminée : {output_video_path}")
+        for r in renditions:
+            print(f"✅ Déclinaison produite : {r['path']}")
 
-    except subprocess.CalledProcessError as e:
+        if proxy:
+            # Chapitres tels que generate_metadata.py les écrira dans la description
+            print("📑 Chapitres de la description :")
+            for line in build_chapter_lines(clips_info):
+                print(f"  {line}")
+            print("👉 Si le montage convient, relancez sans PROXY_PREVIEW pour le rendu master.")
+
+    except (subprocess.CalledProcessError, ProcessStalled) as e:
         print("❌ Erreur FFmpeg :", e)
         sys.exit(1)
     except Exception as e:
         print("❌ Erreur inattendue :", e)
         sys.exit(1)
-    finally:
-        # Nettoyage optionnel : on laisse les fichiers préparés si tu veux debug,
-        # sinon décommente la ligne suivante pour tout supprimer.
-        # shutil.rmtree(PREP_DIR, ignore_errors=True)
-        pass
+    # Nettoyage optionnel : on laisse les fichiers préparés si tu veux debug,
+    # sauf en mode budget disque où ils sont supprimés après un concat réussi.
 
 if __name__ == "__main__":
     compile_video()
@@ -0,0 +1,97 @@
+import subprocess
+import numpy as np
+from process_supervisor import bounded_timeout
+
+# --- Détection des temps morts en début / fin de clip ---
+# Analyse audio : décodage audio seul, mono 8 kHz, énergie RMS par fenêtre
+ANALYSIS_SAMPLE_RATE = 8000
+WINDOW_SECONDS = 0.1
+SILENCE_THRESHOLD_DBFS = -45.0
+# Analyse vidéo : quelques images par seconde en niveaux de gris minuscules,
+# uniquement sur les zones déjà silencieuses
+STATIC_FPS = 4
+STATIC_WIDTH, STATIC_HEIGHT = 64, 36
+STATIC_DIFF_THRESHOLD = 2.0  # écart absolu moyen entre images (0-255)
+
+MIN_TRIM_SECONDS = 0.5        # en dessous, on ne coupe pas
+MAX_TRIM_SECONDS = 8.0        # jamais plus par extrémité
+MIN_REMAINING_SECONDS = 5.0   # durée minimale conservée
+ANALYSIS_TIMEOUT_SECONDS = 120  # par appel ffmpeg, et jamais au-delà de l'échéance du clip
+
+def decode_audio_levels(path, deadline=None):
+    """Retourne le niveau (dBFS) de chaque fenêtre de WINDOW_SECONDS, ou None sans piste audio."""
+    cmd = [
+        "ffmpeg", "-v", "error",
+        "-i", path,
+        "-vn", "-ac", "1", "-ar", str(ANALYSIS_SAMPLE_RATE),
+        "-f", "s16le", "pipe:1"
+    ]
+    result = subprocess.run(cmd, capture_output=True, check=True,
+                            timeout=bounded_timeout(ANALYSIS_TIMEOUT_SECONDS, deadline))
+    samples = np.frombuffer(result.stdout, dtype=np.int16).astype(np.float32) / 32768.0
+    window = int(ANALYSIS_SAMPLE_RATE * WINDOW_SECONDS)
+    if len(samples) < window:
+        return None
+    windows = samples[:len(samples) // window * window].reshape(-1, window)
+    rms = np.sqrt(np.mean(windows ** 2, axis=1))
+    return 20 * np.log10(np.maximum(rms, 1e-6))
+
+def silent_run(levels):
+    """Durée (s) de la suite de fenêtres silencieuses au début de levels."""
+    loud = np.nonzero(levels > SILENCE_THRESHOLD_DBFS)[0]
+    count = loud[0] if len(loud) else len(levels)
+    return count * WINDOW_SECONDS
+
+def static_run(path, start, duration, from_end, deadline=None):
+    """
+    Durée (s) pendant laquelle l'image reste quasi fixe, depuis le début de la zone
+    (ou depuis sa fin si from_end), d'après l'écart moyen entre images successives.
+    """
+    cmd = [
+        "ffmpeg", "-v", "error",
+        "-ss", f"{start:.2f}", "-t", f"{duration:.2f}",
+        "-i", path,
+        "-an", "-vf", f"fps={STATIC_FPS},scale={STATIC_WIDTH}:{STATIC_HEIGHT},format=gray",
+        "-f", "rawvideo", "pipe:1"
+    ]
+    result = subprocess.run(cmd, capture_output=True, check=True,
+                            timeout=bounded_timeout(ANALYSIS_TIMEOUT_SECONDS, deadline))
+    frame_size = STATIC_WIDTH * STATIC_HEIGHT
+    frames = np.frombuffer(result.stdout, dtype=np.uint8)
+    frames = frames[:len(frames) // frame_size * frame_size].reshape(-1, frame_size).astype(np.int16)
+    if len(frames) < 2:
+        return 0.0
+    if from_end:
+        frames = frames[::-1]
+    diffs = np.mean(np.abs(np.diff(frames, axis=0)), axis=1)
+    moving = np.nonzero(diffs > STATIC_DIFF_THRESHOLD)[0]
+    count = moving[0] if len(moving) else len(diffs)
+    return count / STATIC_FPS
+
+def find_trim(path, duration, deadline=None):
+    """
+    Retourne (début à couper, fin à couper) en secondes : une extrémité n'est coupée
+    que si elle est à la fois silencieuse et visuellement quasi fixe.
+    deadline (time.monotonic()) : échéance du clip, l'analyse est abandonnée au-delà.
+    """
+    try:
+        levels = decode_audio_levels(path, deadline)
+        if levels is None:
+            return 0.0, 0.0
+
+        head = min(silent_run(levels), MAX_TRIM_SECONDS)
+        tail = min(silent_run(levels[::-1]), MAX_TRIM_SECONDS)
+        if head >= MIN_TRIM_SECONDS:
+            head = min(head, static_run(path, 0.0, head, from_end=False, deadline=deadline))
+        if tail >= MIN_TRIM_SECONDS:
+            tail = min(tail, static_run(path, duration - tail, tail, from_end=True, deadline=deadline))
+    except (subprocess.CalledProcessError, subprocess.TimeoutExpired, OSError, ValueError) as e:
+        # Simple optimisation : en cas d'échec, le clip est gardé entier
+        print(f"  ⚠️ Analyse des temps morts impossible pour {path}: {e}")
+        return 0.0, 0.0
+
+    head = head if head >= MIN_TRIM_SECONDS else 0.0
+    tail = tail if tail >= MIN_TRIM_SECONDS else 0.0
+    if duration - head - tail < MIN_REMAINING_SECONDS:
+        return 0.0, 0.0
+    return round(head, 1), round(tail, 1)
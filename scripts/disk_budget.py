@@ -0,0 +1,125 @@
+import os
+import sys
+import json
+import shutil
+
+# --- Mode budget disque ---
+# DISK_BUDGET_MB > 0 active le mode : chaque intermédiaire est supprimé dès que
+# tous ses consommateurs ont fini, et l'exécution échoue tôt si le pic estimé
+# dépasse le budget (ou l'espace libre).
+DISK_BUDGET_MB = int(os.getenv("DISK_BUDGET_MB", "0"))
+# Place les intermédiaires de courte durée (téléchargements bruts) en RAM (/dev/shm)
+USE_RAM_TMP = os.getenv("DISK_BUDGET_RAM_TMP", "0") == "1"
+RAM_TMP_ROOT = os.path.join("/dev/shm", "monthlybestof")
+
+# Suivi de l'occupation disque pendant l'exécution
+USAGE_JSON = os.path.join("data", "disk_usage.json")
+TRACKED_DIRS = ["data", "output"]
+
+# Débits moyens estimés (octets par seconde de vidéo) pour l'estimation du pic
+EST_RAW_BYTES_PER_SEC = 1_000_000        # source Twitch 1080p60 (~8 Mb/s)
+EST_PROCESSED_BYTES_PER_SEC = 750_000    # processed_clips (crf 23)
+EST_PREP_BYTES_PER_SEC = 1_250_000       # concat_prep et vidéo finale (crf 18)
+
+MB = 1024 * 1024
+
+def is_enabled():
+    return DISK_BUDGET_MB > 0
+
+def uses_ram_tmp():
+    return is_enabled() and USE_RAM_TMP and os.path.isdir(os.path.dirname(RAM_TMP_ROOT))
+
+def intermediate_dir(default_path, name):
+    """Retourne le dossier RAM pour un intermédiaire de courte durée si le mode le demande."""
+    if uses_ram_tmp():
+        return os.path.join(RAM_TMP_ROOT, name)
+    return default_path
+
+def evict(path):
+    """Supprime un intermédiaire dont tous les consommateurs ont terminé (mode budget uniquement)."""
+    if not is_enabled() or not path or not os.path.exists(path):
+        return
+    if os.path.isdir(path):
+        shutil.rmtree(path, ignore_errors=True)
+    else:
+        os.remove(path)
+    print(f"  🧹 Intermédiaire supprimé : {path}")
+
+def dir_size(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass  # fichier supprimé entre-temps
+    return total
+
+def estimate_peak_bytes(durations):
+    """
+    Estime le pic d'occupation disque d'une exécution en mode budget :
+    - téléchargement : tous les clips traités + le plus gros brut en cours
+    - compilation : clips traités + préparés + vidéo finale (rien n'est supprimé
+      avant la réussite du concat, pour permettre une reprise)
+    """
+    if not durations:
+        return 0
+    total = sum(durations)
+    longest = max(durations)
+    raw_peak = 0 if uses_ram_tmp() else longest * EST_RAW_BYTES_PER_SEC
+    download_peak = total * EST_PROCESSED_BYTES_PER_SEC + raw_peak
+    compile_peak = total * (EST_PROCESSED_BYTES_PER_SEC + 2 * EST_PREP_BYTES_PER_SEC)
+    return int(max(download_peak, compile_peak))
+
+def check_budget(durations):
+    """Échoue immédiatement si le pic estimé ne tient pas dans le budget ou l'espace libre."""
+    if not is_enabled():
+        return
+    estimate = estimate_peak_bytes(durations)
+    budget = DISK_BUDGET_MB * MB
+    already_used = sum(dir_size(d) for d in TRACKED_DIRS if os.path.isdir(d))
+    free = shutil.disk_usage(".").free + already_used
+    limit = min(budget, free)
+    print(f"💽 Pic disque estimé : {estimate / MB:.0f} Mo (budget {DISK_BUDGET_MB} Mo, libre {free / MB:.0f} Mo)")
+    if estimate > limit:
+        print(f"❌ Budget disque insuffisant : il faudrait environ {estimate / MB:.0f} Mo "
+              f"pour {sum(durations):.0f}s de clips, {limit / MB:.0f} Mo disponibles.")
+        print("   Augmentez DISK_BUDGET_MB, activez DISK_BUDGET_RAM_TMP=1 ou réduisez la durée totale.")
+        sys.exit(1)
+
+def record_usage(stage):
+    """Mesure l'occupation actuelle et met à jour le pic de l'exécution dans USAGE_JSON."""
+    disk = sum(dir_size(d) for d in TRACKED_DIRS if os.path.isdir(d))
+    ram = dir_size(RAM_TMP_ROOT) if os.path.isdir(RAM_TMP_ROOT) else 0
+
+    usage = {"peak_disk_bytes": 0, "peak_ram_bytes": 0, "stages": {}}
+    if os.path.exists(USAGE_JSON):
+        try:
+            with open(USAGE_JSON, "r", encoding="utf-8") as f:
+                usage = json.load(f)
+        except (OSError, ValueError):
+            pass
+
+    usage["peak_disk_bytes"] = max(usage.get("peak_disk_bytes", 0), disk)
+    usage["peak_ram_bytes"] = max(usage.get("peak_ram_bytes", 0), ram)
+    stages = usage.setdefault("stages", {})
+    stages[stage] = max(stages.get(stage, 0), disk)
+
+    os.makedirs(os.path.dirname(USAGE_JSON), exist_ok=True)
+    with open(USAGE_JSON, "w", encoding="utf-8") as f:
+        json.dump(usage, f, indent=2)
+    return disk
+
+def reset_usage():
+    if os.path.exists(USAGE_JSON):
+        os.remove(USAGE_JSON)
+
+def print_usage_report():
+    if not os.path.exists(USAGE_JSON):
+        return
+    with open(USAGE_JSON, "r", encoding="utf-8") as f:
+        usage = json.load(f)
+    print(f"💽 Pic d'occupation disque : {usage.get('peak_disk_bytes', 0) / MB:.0f} Mo"
+          f" (RAM : {usage.get('peak_ram_bytes', 0) / MB:.0f} Mo)")
+    for stage, peak in usage.get("stages", {}).items():
+        print(f"   {stage:<10} {peak / MB:8.0f} Mo")
@@ -3,12 +3,33 @@ import os
 import json
 import sys
 import re # Importation pour les expressions régulières
+import time
+import disk_budget
+import loudness
+from dead_air import find_trim
+from process_supervisor import (
+    FFPROBE_TIMEOUT_SECONDS, MAX_STALL_RETRIES, STALL_TIMEOUT_SECONDS,
+    ProcessStalled, clip_deadline, run_supervised
+)
+
+try:
+    import yt_dlp  # API embarquée : une seule instance partagée entre tous les clips
+except ImportError:
+    yt_dlp = None  # repli sur la CLI yt-dlp
 
 INPUT_CLIPS_JSON = os.path.join("data", "top_clips.json")
-RAW_CLIPS_DIR = os.path.join("data", "raw_clips") # Keep original downloads here
+RESERVE_CLIPS_JSON = os.path.join("data", "reserve_clips.json") # Clips suivants si la découpe raccourcit trop la vidéo
+RAW_CLIPS_DIR = disk_budget.intermediate_dir(os.path.join("data", "raw_clips"), "raw_clips") # Keep original downloads here (RAM en mode budget disque)
 PROCESSED_CLIPS_DIR = os.path.join("data", "processed_clips") # New directory for consistent clips
 CLIP_FRAMES_DIR = os.path.join("data", "clip_frames") # Nouveau dossier pour les frames extraites
 
+YTDLP_FORMAT = "bestvideo[ext=mp4]+bestaudio[ext=m4a]/best[ext=mp4]/best"
+
+# Profil de sortie : la source n'a pas besoin d'être plus grande / plus fluide que ça
+TARGET_WIDTH = 1920
+TARGET_HEIGHT = 1080
+TARGET_FPS = 30
+
 def get_video_duration(filepath):
     """
     Obtient la durée d'une vidéo en secondes en utilisant ffprobe.
@@ -22,12 +43,127 @@ def get_video_duration(filepath):
             "-of", "default=noprint_wrappers=1:nokey=1",
             filepath
         ]
-        result = subprocess.run(cmd, capture_output=True, text=True, check=True)
+        result = subprocess.run(cmd, capture_output=True, text=True, check=True, timeout=FFPROBE_TIMEOUT_SECONDS)
         return float(result.stdout.strip())
-    except (subprocess.CalledProcessError, ValueError) as e:
+    except (subprocess.CalledProcessError, subprocess.TimeoutExpired, ValueError) as e:
         print(f"  ⚠️ Impossible d'obtenir la durée de {filepath} avec ffprobe: {e}")
         return 0.0
 
+def estimate_format_bytes(ydl, fmt):
+    """Taille d'un format : annoncée par l'extracteur, sinon via une requête HEAD (connexion réutilisée)."""
+    size = fmt.get("filesize") or fmt.get("filesize_approx")
+    if size or not fmt.get("url"):
+        return size
+    try:
+        with ydl.urlopen(yt_dlp.networking.HEADRequest(fmt["url"], headers=fmt.get("http_headers"))) as response:
+            return int(response.headers.get("Content-Length", 0)) or None
+    except Exception:
+        return None
+
+def pick_target_format(formats):
+    """
+    Choisit le plus petit rendu (hauteur puis fps) qui atteint encore le profil de sortie,
+    sans descendre sous ce que la source peut offrir (pas d'upscaling évitable).
+    Retourne (format choisi, meilleur format), ou (None, None) si aucun format vidéo+audio.
+    """
+    candidates = [
+        f for f in formats
+        if f.get("height") and f.get("vcodec") != "none" and f.get("acodec") != "none"
+        and not str(f.get("format_id", "")).startswith("portrait")  # recadrages verticaux Twitch
+    ]
+    if not candidates:
+        return None, None
+    best = max(candidates, key=lambda f: (f["height"], f.get("fps") or 0))
+    needed_height = min(TARGET_HEIGHT, best["height"])
+    needed_fps = min(TARGET_FPS, best.get("fps") or TARGET_FPS)
+    sufficient = [
+        f for f in candidates
+        if f["height"] >= needed_height and (f.get("fps") or TARGET_FPS) >= needed_fps
+    ]
+    chosen = min(sufficient, key=lambda f: (f["height"], f.get("fps") or 0))
+    return chosen, best
+
+def create_downloader():
+    """
+    Crée l'instance YoutubeDL partagée par tous les téléchargements : l'extracteur
+    Twitch et les connexions HTTP (GQL, CDN) sont initialisés une seule fois.
+    Retourne (instance, état des hooks), ou (None, None) si l'API n'est pas disponible.
+    """
+    if yt_dlp is None:
+        return None, None
+
+    state = {"deadline": None, "next_percent": 25}
+
+    def progress_hook(d):
+        if state["deadline"] is not None and time.monotonic() > state["deadline"]:
+            raise yt_dlp.utils.DownloadCancelled("budget de temps du clip dépassé")
+        if d["status"] == "downloading":
+            total = d.get("total_bytes") or d.get("total_bytes_estimate")
+            if total:
+                percent = 100 * d.get("downloaded_bytes", 0) / total
+                if percent >= state["next_percent"]:
+                    print(f"  ⬇️ {percent:.0f}% de {total / 1024 / 1024:.1f} Mo")
+                    state["next_percent"] = (int(percent) // 25 + 1) * 25
+        elif d["status"] == "finished":
+            size = d.get("total_bytes") or d.get("downloaded_bytes") or 0
+            print(f"  ⬇️ {size / 1024 / 1024:.1f} Mo reçus en {d.get('elapsed', 0):.1f}s")
+
+    fallback = {}
+
+    def label(f):
+        return f"{f['height']}p{f.get('fps') or 0:.0f}"
+
+    def target_format_selector(ctx):
+        chosen, best = pick_target_format(ctx["formats"])
+        if chosen is None:
+            yield from fallback["selector"](ctx)
+            return
+        if chosen is best:
+            print(f"  🎯 Format {label(chosen)} (déjà au plus près du profil {TARGET_HEIGHT}p{TARGET_FPS})")
+        else:
+            chosen_bytes = estimate_format_bytes(ydl, chosen)
+            best_bytes = estimate_format_bytes(ydl, best)
+            saved = f"{(best_bytes - chosen_bytes) / 1024 / 1024:.1f} Mo économisés" if chosen_bytes and best_bytes else "gain non mesurable"
+            print(f"  🎯 Format {label(chosen)} au lieu de {label(best)} : {saved}")
+        yield chosen
+
+    ydl = yt_dlp.YoutubeDL({
+        "format": target_format_selector,
+        "outtmpl": {"default": os.path.join(RAW_CLIPS_DIR, "%(id)s.%(ext)s")},
+        "quiet": True,
+        "noprogress": True,
+        "socket_timeout": STALL_TIMEOUT_SECONDS,
+        "retries": MAX_STALL_RETRIES,
+        "progress_hooks": [progress_hook],
+    })
+    fallback["selector"] = ydl.build_format_selector(YTDLP_FORMAT)
+    return ydl, state
+
+def download_clip(ydl, state, clip_url, output_path, deadline):
+    """Télécharge un clip via l'instance partagée, ou via la CLI si l'API échoue ou est absente."""
+    if ydl is not None:
+        ydl.params["outtmpl"]["default"] = output_path
+        state["deadline"] = deadline
+        state["next_percent"] = 25
+        started = time.monotonic()
+        try:
+            ydl.download([clip_url])
+            return
+        except yt_dlp.utils.DownloadCancelled:
+            raise ProcessStalled(["yt-dlp", clip_url], time.monotonic() - started)
+        except yt_dlp.utils.DownloadError as e:
+            print(f"  ⚠️ Échec du téléchargement intégré ({e}), repli sur la CLI yt-dlp...")
+
+    yt_dlp_command = [
+        "yt-dlp",
+        "--output", output_path,
+        "--format", YTDLP_FORMAT,
+        # Même logique que le sélecteur intégré : plus grand rendu <= cible, sinon le plus petit au-dessus
+        "--format-sort", f"res:{TARGET_HEIGHT},fps:{TARGET_FPS}",
+        clip_url
+    ]
+    run_supervised(yt_dlp_command, deadline=deadline, echo=True)
+
 def ffmpeg_escape_string(text):
     """
     Escapes characters in a string for FFmpeg drawtext filter to prevent syntax errors.
@@ -43,6 +179,161 @@ def ffmpeg_escape_string(text):
     text = text.replace(',', '\\,')
     return text
 
+def load_reserve():
+    """Retourne (clips de réserve, durée totale minimale visée) écrits par get_top_clips.py."""
+    if not os.path.exists(RESERVE_CLIPS_JSON):
+        return [], 0
+    with open(RESERVE_CLIPS_JSON, "r", encoding="utf-8") as f:
+        reserve = json.load(f)
+    return reserve.get("clips", []), reserve.get("min_total_duration", 0)
+
+def process_clip(clip, label, ydl, ydl_state):
+    """
+    Télécharge, analyse (temps morts), prétraite un clip et extrait sa première frame.
+    Retourne les infos du clip traité, ou None en cas d'échec.
+    """
+    clip_url = clip["url"]
+
+    clip_id = clip.get("id", f"unknown_id_{label}")
+    clip_title_raw = clip.get("title", "Titre inconnu")
+    broadcaster_name_raw = clip.get("broadcaster_name", "Streamer inconnu")
+
+    clip_title_escaped = ffmpeg_escape_string(clip_title_raw)
+    broadcaster_name_escaped = ffmpeg_escape_string(broadcaster_name_raw)
+
+    raw_output_filename = os.path.join(RAW_CLIPS_DIR, f"{clip_id}_raw.mp4")
+    processed_output_filename = os.path.join(PROCESSED_CLIPS_DIR, f"{clip_id}_processed.mp4")
+    first_frame_output_path = os.path.join(CLIP_FRAMES_DIR, f"{clip_id}_first_frame.jpg") # Chemin de la frame
+
+    print(f"Téléchargement du clip {label}: {clip_title_raw} par {broadcaster_name_raw} (ID: {clip_id})...")
+    # Budget de temps global du clip : un clip bloqué ne peut pas retarder toute l'exécution
+    deadline = clip_deadline()
+    try:
+        # 1. Téléchargement avec yt-dlp (instance partagée, CLI en repli)
+        download_clip(ydl, ydl_state, clip_url, raw_output_filename, deadline)
+        print(f"  ✅ Clip téléchargé: {raw_output_filename}")
+
+        # 2. Temps morts en début / fin (audio seul + différence d'images basse résolution)
+        source_duration = get_video_duration(raw_output_filename)
+        trim_start, trim_end = find_trim(raw_output_filename, source_duration, deadline) if source_duration > 0 else (0.0, 0.0)
+        trim_args = []
+        if trim_start or trim_end:
+            print(f"  ✂️ Temps morts coupés : {trim_start:.1f}s au début, {trim_end:.1f}s à la fin.")
+            trim_args = ["-ss", f"{trim_start:.2f}", "-t", f"{source_duration - trim_start - trim_end:.2f}"]
+
+        # Mesure de sonie sur un décodage audio seul, en parallèle de l'encodage vidéo ci-dessous
+        loudness_future = loudness.measure_async(raw_output_filename, trim_args, deadline)
+
+        # 3. Prétraitement avec FFmpeg pour normaliser le format, les codecs et ajouter du texte
+        print(f"  Prétraitement du clip {label}: {clip_title_raw} (ajout du texte)...")
+
+        title_display = clip_title_escaped
+        broadcaster_display = broadcaster_name_escaped
+
+        font_path = "/usr/share/fonts/truetype/liberation/LiberationSans-Regular.ttf"
+        if not os.path.exists(font_path):
+            font_path = "/usr/share/fonts/truetype/dejavu/DejaVuSans-Regular.ttf"
+            if not os.path.exists(font_path):
+                font_path = "sans-serif" # Generic font family name for FFmpeg
+                print(f"⚠️ Police spécifique non trouvée. Utilisation d'une police générique '{font_path}'.")
+
+        font_size = 36
+        text_color = "white"
+        border_color = "black"
+        border_width = 2
+
+        title_filter = (
+            f"drawtext=fontfile='{font_path}':"
+            f"text='{title_display}':"
+            f"x=(w-text_w)/2:y=H*0.04:"
+            f"fontcolor={text_color}:fontsize={font_size}:"
+            f"bordercolor={border_color}:borderw={border_width}"
+        )
+
+        broadcaster_filter = (
+            f"drawtext=fontfile='{font_path}':"
+            f"text='{broadcaster_display}':"
+            f"x=(w-text_w)/2:y=H*0.04+text_h+5:"
+            f"fontcolor={text_color}:fontsize={font_size}:"
+            f"bordercolor={border_color}:borderw={border_width}"
+        )
+
+        video_filters = (
+            f"scale={TARGET_WIDTH}:{TARGET_HEIGHT}:force_original_aspect_ratio=decrease,"
+            f"pad={TARGET_WIDTH}:{TARGET_HEIGHT}:(ow-iw)/2:(oh-ih)/2,"
+            f"setsar=1,fps={TARGET_FPS},"
+            f"{title_filter},"
+            f"{broadcaster_filter}"
+        )
+
+        ffmpeg_preprocess_command = [
+            "ffmpeg",
+            *trim_args,
+            "-i", raw_output_filename,
+            "-vf", video_filters,
+            "-c:v", "libx264",
+            "-preset", "fast",
+            "-crf", "23",
+            "-pix_fmt", "yuv420p",
+            "-c:a", "aac",
+            "-b:a", "192k",
+            "-ac", "2",
+            "-ar", "44100",
+            "-loglevel", "error",
+            "-y",
+            processed_output_filename
+        ]
+        run_supervised(ffmpeg_preprocess_command, deadline=deadline)
+        print(f"  ✅ Clip prétraité avec texte: {processed_output_filename}")
+
+        # --- NOUVEAU : Extraire la première frame du clip traité ---
+        print(f"  Extraction de la première frame pour {clip_id}...")
+        ffmpeg_extract_frame_command = [
+            "ffmpeg",
+            "-i", processed_output_filename,
+            "-vframes", "1",
+            "-q:v", "2", # Qualité de sortie (1-31, 1 est le meilleur)
+            "-y",
+            first_frame_output_path
+        ]
+        run_supervised(ffmpeg_extract_frame_command, deadline=deadline)
+        print(f"  ✅ Première frame extraite: {first_frame_output_path}")
+        # --- FIN NOUVEAU ---
+
+        actual_duration = get_video_duration(processed_output_filename)
+        print(f"  Durée réelle du clip traité: {actual_duration:.2f} secondes.")
+
+        loudness_measurement = loudness_future.result()
+        if loudness_measurement:
+            print(f"  🔊 Sonie mesurée : {loudness_measurement['integrated_lufs']:.1f} LUFS "
+                  f"(true peak {loudness_measurement['true_peak_dbtp']:.1f} dBTP)")
+
+        return {
+            "id": clip_id,
+            "path": processed_output_filename,
+            "duration": actual_duration,
+            "title": clip_title_raw,
+            "broadcaster_name": broadcaster_name_raw,
+            "first_frame_path": first_frame_output_path, # Ajoute le chemin de la frame
+            "source_duration": source_duration,
+            "trim_start": trim_start,
+            "trim_end": trim_end,
+            "loudness": loudness_measurement # Appliquée en un seul passage par compile_video.py
+        }
+
+    except subprocess.CalledProcessError as e:
+        print(f"  ❌ Erreur lors du traitement du clip {clip_url} (téléchargement ou prétraitement/extraction frame): {e}")
+        if e.stdout: print(f"    STDOUT: {e.stdout}")
+        if e.stderr: print(f"    STDERR: {e.stderr}")
+    except ProcessStalled as e:
+        print(f"  ❌ Clip {clip_url} abandonné (bloqué ou budget de temps dépassé): {e}")
+    except Exception as e:
+        print(f"  ❌ Erreur inattendue lors du traitement du clip {clip_url}: {e}")
+    finally:
+        # Le brut n'a qu'un consommateur (le prétraitement) : on peut l'évincer
+        disk_budget.record_usage("download")
+        disk_budget.evict(raw_output_filename)
+
 def download_clips():
     print("📥 Démarrage du téléchargement et du prétraitement des clips Twitch individuels...")
     os.makedirs(RAW_CLIPS_DIR, exist_ok=True)
@@ -77,126 +368,31 @@ def download_clips():
             json.dump([], f)
         return
 
+    # Mode budget disque : échouer tout de suite si le pic estimé ne tient pas
+    disk_budget.check_budget([float(c.get("duration", 0.0)) for c in clips])
+
     downloaded_and_processed_info = [] # Will store dicts with path, id, and actual duration
+    ydl, ydl_state = create_downloader()
     for i, clip in enumerate(clips):
-        clip_url = clip["url"]
-
-        clip_id = clip.get("id", f"unknown_id_{i}")
-        clip_title_raw = clip.get("title", "Titre inconnu")
-        broadcaster_name_raw = clip.get("broadcaster_name", "Streamer inconnu")
+        info = process_clip(clip, f"{i+1}/{len(clips)}", ydl, ydl_state)
+        if info:
+            downloaded_and_processed_info.append(info)
 
-        clip_title_escaped = ffmpeg_escape_string(clip_title_raw)
-        broadcaster_name_escaped = ffmpeg_escape_string(broadcaster_name_raw)
+    # Le budget de durée de get_top_clips porte sur les durées Twitch : une fois les temps
+    # morts retirés, on complète avec les clips de réserve jusqu'à l'atteindre
+    reserve, min_total_duration = load_reserve()
+    total_duration = sum(c["duration"] for c in downloaded_and_processed_info)
+    for j, clip in enumerate(reserve):
+        if total_duration >= min_total_duration:
+            break
+        print(f"➕ Durée après découpe {total_duration:.1f}s < {min_total_duration}s : ajout d'un clip de réserve.")
+        info = process_clip(clip, f"réserve {j+1}/{len(reserve)}", ydl, ydl_state)
+        if info:
+            downloaded_and_processed_info.append(info)
+            total_duration += info["duration"]
 
-        raw_output_filename = os.path.join(RAW_CLIPS_DIR, f"{clip_id}_raw.mp4")
-        processed_output_filename = os.path.join(PROCESSED_CLIPS_DIR, f"{clip_id}_processed.mp4")
-        first_frame_output_path = os.path.join(CLIP_FRAMES_DIR, f"{clip_id}_first_frame.jpg") # Chemin de la frame
-
-        print(f"Téléchargement du clip {i+1}/{len(clips)}: {clip_title_raw} par {broadcaster_name_raw} (ID: {clip_id})...")
-        try:
-            # 1. Téléchargement avec yt-dlp
-            yt_dlp_command = [
-                "yt-dlp",
-                "--output", raw_output_filename,
-                "--format", "bestvideo[ext=mp4]+bestaudio[ext=m4a]/best[ext=mp4]/best",
-                clip_url
-            ]
-            subprocess.run(yt_dlp_command, check=True)
-            print(f"  ✅ Clip téléchargé: {raw_output_filename}")
-
-            # 2. Prétraitement avec FFmpeg pour normaliser le format, les codecs et ajouter du texte
-            print(f"  Prétraitement du clip {i+1}/{len(clips)}: {clip_title_raw} (ajout du texte)...")
-
-            title_display = clip_title_escaped
-            broadcaster_display = broadcaster_name_escaped
-
-            font_path = "/usr/share/fonts/truetype/liberation/LiberationSans-Regular.ttf"
-            if not os.path.exists(font_path):
-                font_path = "/usr/share/fonts/truetype/dejavu/DejaVuSans-Regular.ttf"
-                if not os.path.exists(font_path):
-                    font_path = "sans-serif" # Generic font family name for FFmpeg
-                    print(f"⚠️ Police spécifique non trouvée. Utilisation d'une police générique '{font_path}'.")
-
-            font_size = 36
-            text_color = "white"
-            border_color = "black"
-            border_width = 2
-
-            title_filter = (
-                f"drawtext=fontfile='{font_path}':"
-                f"text='{title_display}':"
-                f"x=(w-text_w)/2:y=H*0.04:"
-                f"fontcolor={text_color}:fontsize={font_size}:"
-                f"bordercolor={border_color}:borderw={border_width}"
-            )
-
-            broadcaster_filter = (
-                f"drawtext=fontfile='{font_path}':"
-                f"text='{broadcaster_display}':"
-                f"x=(w-text_w)/2:y=H*0.04+text_h+5:"
-                f"fontcolor={text_color}:fontsize={font_size}:"
-                f"bordercolor={border_color}:borderw={border_width}"
-            )
-
-            video_filters = (
-                "scale=1920:1080:force_original_aspect_ratio=decrease,"
-                "pad=1920:1080:(ow-iw)/2:(oh-ih)/2,"
-                "setsar=1,fps=30,"
-                f"{title_filter},"
-                f"{broadcaster_filter}"
-            )
-
-            ffmpeg_preprocess_command = [
-                "ffmpeg",
-                "-i", raw_output_filename,
-                "-vf", video_filters,
-                "-c:v", "libx264",
-                "-preset", "fast",
-                "-crf", "23",
-                "-pix_fmt", "yuv420p",
-                "-c:a", "aac",
-                "-b:a", "192k",
-                "-ac", "2",
-                "-ar", "44100",
-                "-loglevel", "error",
-                "-y",
-                processed_output_filename
-            ]
-            subprocess.run(ffmpeg_preprocess_command, check=True, capture_output=True, text=True)
-            print(f"  ✅ Clip prétraité avec texte: {processed_output_filename}")
-
-            # --- NOUVEAU : Extraire la première frame du clip traité ---
-            print(f"  Extraction de la première frame pour {clip_id}...")
-            ffmpeg_extract_frame_command = [
-                "ffmpeg",
-                "-i", processed_output_filename,
-                "-vframes", "1",
-                "-q:v", "2", # Qualité de sortie (1-31, 1 est le meilleur)
-                "-y",
-                first_frame_output_path
-            ]
-            subprocess.run(ffmpeg_extract_frame_command, check=True, capture_output=True, text=True)
-            print(f"  ✅ Première frame extraite: {first_frame_output_path}")
-            # --- FIN NOUVEAU ---
-
-            actual_duration = get_video_duration(processed_output_filename)
-            print(f"  Durée réelle du clip traité: {actual_duration:.2f} secondes.")
-
-            downloaded_and_processed_info.append({
-                "id": clip_id,
-                "path": processed_output_filename,
-                "duration": actual_duration,
-                "title": clip_title_raw,
-                "broadcaster_name": broadcaster_name_raw,
-                "first_frame_path": first_frame_output_path # Ajoute le chemin de la frame
-            })
-
-        except subprocess.CalledProcessError as e:
-            print(f"  ❌ Erreur lors du traitement du clip {clip_url} (téléchargement ou prétraitement/extraction frame): {e}")
-            if e.stdout: print(f"    STDOUT: {e.stdout}")
-            if e.stderr: print(f"    STDERR: {e.stderr}")
-        except Exception as e:
-            print(f"  ❌ Erreur inattendue lors du traitement du clip {clip_url}: {e}")
+    if ydl is not None:
+        ydl.close()
 
     with open(os.path.join("data", "downloaded_clip_paths.json"), "w", encoding="utf-8") as f:
         json.dump(downloaded_and_processed_info, f, ensure_ascii=False, indent=2)
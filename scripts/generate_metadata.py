@@ -30,6 +30,18 @@ def get_current_month_fr_upper():
     m = datetime.now().month
     return MONTHS_FR[m - 1]
 
+def build_chapter_lines(clips_info):
+    """Lignes de chapitres 'HH:MM:SS - titre' à partir de la durée de chaque clip."""
+    lines = []
+    current_offset = 0.0
+    for clip_info in clips_info:
+        clip_duration = clip_info.get("duration", 0.0)
+        clip_title = clip_info.get("title", "Clip inconnu")
+        timecode = format_duration(current_offset)
+        lines.append(f"{timecode} - {clip_title}")
+        current_offset += clip_duration
+    return lines
+
 def generate_metadata():
     print("📝 Génération des métadonnées vidéo (titre, description, tags)...")
 
@@ -82,13 +94,7 @@ def generate_metadata():
         "📺 Active la cloche 🔔 et abonne-toi pour ne rien rater."
     ]
 
-    current_offset = 0.0
-    for clip_info in downloaded_clips_info:
-        clip_duration = clip_info.get("duration", 0.0)
-        clip_title = clip_info.get("title", "Clip inconnu")
-        timecode = format_duration(current_offset)
-        description_lines.append(f"{timecode} - {clip_title}")
-        current_offset += clip_duration
+    description_lines.extend(build_chapter_lines(downloaded_clips_info))
 
     description_lines.extend([
         "",
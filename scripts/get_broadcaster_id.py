@@ -1,22 +1,34 @@
 import requests
 import os
 import sys
+import time
 import json # Import pour afficher la réponse si besoin
 
 # Récupérer les identifiants Twitch depuis les variables d'environnement
 CLIENT_ID = os.getenv("TWITCH_CLIENT_ID")
 CLIENT_SECRET = os.getenv("TWITCH_CLIENT_SECRET")
 
-if not CLIENT_ID or not CLIENT_SECRET:
-    print("❌ ERREUR: Les variables d'environnement TWITCH_CLIENT_ID ou TWITCH_CLIENT_SECRET ne sont pas définies.")
-    print("Veuillez les définir avant d'exécuter ce script (par exemple, 'export TWITCH_CLIENT_ID=votre_id').")
-    sys.exit(1)
-
 TWITCH_AUTH_URL = "https://id.twitch.tv/oauth2/token"
 TWITCH_USERS_API_URL = "https://api.twitch.tv/helix/users"
 
+# --- Résolution en masse ---
+USERS_BATCH_SIZE = 100  # Helix /users accepte jusqu'à 100 paramètres 'login' par requête
+CACHE_JSON = os.path.join("data", "broadcaster_ids_cache.json")
+CACHE_TTL_SECONDS = 7 * 24 * 3600
+# Codes de sortie du mode non interactif
+EXIT_UNKNOWN_LOGINS = 1  # au moins un login n'existe pas
+EXIT_API_ERROR = 2       # au moins un lot n'a pas pu être interrogé (réseau, HTTP)
+
+def check_credentials():
+    """Les identifiants ne sont nécessaires que si une requête API doit être faite."""
+    if not CLIENT_ID or not CLIENT_SECRET:
+        print("❌ ERREUR: Les variables d'environnement TWITCH_CLIENT_ID ou TWITCH_CLIENT_SECRET ne sont pas définies.")
+        print("Veuillez les définir avant d'exécuter ce script (par exemple, 'export TWITCH_CLIENT_ID=votre_id').")
+        sys.exit(1)
+
 def get_twitch_access_token():
     """Récupère un jeton d'accès d'application pour l'API Twitch."""
+    check_credentials()
     print("🔑 Tentative de récupération du jeton d'accès Twitch...")
     payload = {
         "client_id": CLIENT_ID,
@@ -69,7 +81,89 @@ def get_broadcaster_id(access_token, streamer_login):
             print(f"    Contenu brut de la réponse: {response.content.decode()}")
         return None
 
+def load_cache():
+    """Charge le cache login -> id en ignorant les entrées expirées."""
+    if not os.path.exists(CACHE_JSON):
+        return {}
+    try:
+        with open(CACHE_JSON, "r", encoding="utf-8") as f:
+            cache = json.load(f)
+    except (OSError, json.JSONDecodeError):
+        print(f"⚠️ Cache illisible, ignoré : {CACHE_JSON}")
+        return {}
+    now = time.time()
+    return {login: entry for login, entry in cache.items() if now - entry.get("fetched_at", 0) < CACHE_TTL_SECONDS}
+
+def save_cache(cache):
+    os.makedirs(os.path.dirname(CACHE_JSON), exist_ok=True)
+    with open(CACHE_JSON, "w", encoding="utf-8") as f:
+        json.dump(cache, f, ensure_ascii=False, indent=2)
+
+def resolve_broadcaster_ids(logins, access_token=None):
+    """
+    Résout une liste de logins en IDs : le cache local répond d'abord, le reste est
+    demandé à Helix par lots de 100 sur une seule connexion.
+    Retourne (résultats, échecs) : résultats associe login -> id (None si le login
+    n'existe pas), échecs liste les logins dont le lot a échoué côté API.
+    """
+    logins = list(dict.fromkeys(login.strip().lower() for login in logins if login.strip()))
+    cache = load_cache()
+    results = {login: cache[login]["id"] for login in logins if login in cache}
+    missing = [login for login in logins if login not in results]
+    failed = []
+    print(f"🗂️ {len(results)} login(s) trouvés en cache, {len(missing)} à résoudre via l'API.")
+
+    if missing:
+        token = access_token or get_twitch_access_token()
+        headers = {
+            "Client-ID": CLIENT_ID,
+            "Authorization": f"Bearer {token}"
+        }
+        with requests.Session() as session:
+            for start in range(0, len(missing), USERS_BATCH_SIZE):
+                batch = missing[start:start + USERS_BATCH_SIZE]
+                print(f"🔍 Requête Helix pour {len(batch)} login(s)...")
+                try:
+                    response = session.get(TWITCH_USERS_API_URL, headers=headers, params=[("login", login) for login in batch])
+                    response.raise_for_status()
+                    users = response.json().get("data", [])
+                except (requests.exceptions.RequestException, json.JSONDecodeError) as e:
+                    print(f"❌ Erreur lors de la requête API Twitch pour ce lot : {e}")
+                    failed.extend(batch)
+                    continue
+                now = time.time()
+                for user in users:
+                    login = user["login"].lower()
+                    results[login] = user["id"]
+                    cache[login] = {"id": user["id"], "fetched_at": now}
+        save_cache(cache)
+
+    results = {login: results.get(login) for login in logins if login not in failed}
+    return results, failed
+
+def read_logins(args):
+    """Logins passés en arguments, ou lus depuis un fichier (--file chemin, '-' pour stdin)."""
+    if len(args) == 2 and args[0] == "--file":
+        handle = sys.stdin if args[1] == "-" else open(args[1], "r", encoding="utf-8")
+        with handle:
+            return [line.split("#")[0].strip() for line in handle if line.split("#")[0].strip()]
+    return args
+
 if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        # Mode non interactif : python get_broadcaster_id.py login1 login2 ... | --file logins.txt
+        resolved, failed = resolve_broadcaster_ids(read_logins(sys.argv[1:]))
+        for login, broadcaster_id in resolved.items():
+            if broadcaster_id:
+                print(f"{login} : {broadcaster_id}")
+            else:
+                print(f"⚠️ {login} : introuvable")
+        for login in failed:
+            print(f"❌ {login} : erreur API, non résolu (réessayez plus tard)")
+        if failed:
+            sys.exit(EXIT_API_ERROR)
+        sys.exit(0 if all(resolved.values()) else EXIT_UNKNOWN_LOGINS)
+
     token = get_twitch_access_token()
     if token:
         # Demande à l'utilisateur d'entrer le nom du streamer
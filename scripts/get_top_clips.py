@@ -12,11 +12,13 @@ if not CLIENT_ID or not CLIENT_SECRET:
 AUTH_URL = "https://id.twitch.tv/oauth2/token"
 CLIPS_URL = "https://api.twitch.tv/helix/clips"
 OUTPUT = os.path.join("data", "top_clips.json")
+RESERVE_OUTPUT = os.path.join("data", "reserve_clips.json")  # clips suivants, si la découpe des temps morts raccourcit la vidéo
 
 BROADCASTER_ID = "737048563"  # Anyme023
 DAYS_BACK = 30
 MIN_VIDEO_DURATION_SECONDS = 850  # Durée minimale totale
 MAX_CLIPS_PER_STREAMER = 999      # Limite max de clips
+MAX_RESERVE_CLIPS = 15            # Clips de réserve proposés à download_clips.py
 
 def _as_rfc3339(dt: datetime) -> str:
     # Twitch accepte RFC3339; on force le 'Z' pour l'UTC
@@ -95,6 +97,17 @@ def get_top_clips(access_token=None, num_clips_per_source=50, days_ago=DAYS_BACK
     with open(OUTPUT, "w", encoding="utf-8") as f:
         json.dump(final_clips, f, ensure_ascii=False, indent=2)
 
+    # Réserve : les clips suivants par vues. download_clips.py y puise si, une fois
+    # les temps morts coupés, la durée totale repasse sous MIN_VIDEO_DURATION_SECONDS
+    selected_ids = {c.get("id") for c in final_clips}
+    reserve = [c for c in sorted(all_clips, key=lambda c: c.get("view_count", 0), reverse=True)
+               if c.get("id") not in selected_ids and float(c.get("duration", 0.0)) > 0]
+    with open(RESERVE_OUTPUT, "w", encoding="utf-8") as f:
+        json.dump({
+            "min_total_duration": MIN_VIDEO_DURATION_SECONDS,
+            "clips": reserve[:MAX_RESERVE_CLIPS]
+        }, f, ensure_ascii=False, indent=2)
+
     # (Optionnel) Warning si la durée n'atteint pas 850s
     if total_duration < MIN_VIDEO_DURATION_SECONDS and final_clips:
         print(f"⚠️ Durée totale {total_duration:.1f}s < {MIN_VIDEO_DURATION_SECONDS}s (clips disponibles insuffisants).")
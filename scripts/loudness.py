@@ -0,0 +1,88 @@
+import os
+import json
+import subprocess
+from concurrent.futures import Future, ThreadPoolExecutor
+from process_supervisor import bounded_timeout
+
+# --- Normalisation du volume ---
+# Chaque clip est mesuré sur un décodage audio seul (en parallèle de l'encodage vidéo),
+# puis loudnorm l'amène sur la cible avec ces mesures lors de l'encodage suivant :
+# pas de second passage d'analyse.
+NORMALIZE_LOUDNESS = os.getenv("NORMALIZE_LOUDNESS", "1") == "1"
+TARGET_LUFS = -14.0           # référence YouTube
+TRUE_PEAK_LIMIT_DBTP = -1.0   # au-delà, loudnorm limite les crêtes au lieu de baisser le gain
+TARGET_LRA = 20.0             # large : la plupart des clips restent en gain linéaire
+ANALYSIS_TIMEOUT_SECONDS = 300  # jamais au-delà de l'échéance du clip si elle est fournie
+
+_executor = ThreadPoolExecutor(max_workers=2)
+
+def parse_loudnorm_report(stderr):
+    """Le rapport JSON de loudnorm (print_format=json) est le dernier bloc {...} de stderr."""
+    return json.loads(stderr[stderr.rindex("{"):stderr.rindex("}") + 1])
+
+def loudnorm_targets():
+    return f"loudnorm=I={TARGET_LUFS}:TP={TRUE_PEAK_LIMIT_DBTP}:LRA={TARGET_LRA}"
+
+def measure_loudness(path, trim_args=(), deadline=None):
+    """
+    Mesure la sonie intégrée (LUFS), le true peak (dBTP), la plage (LRA) et le seuil
+    via loudnorm en analyse, sur l'audio seul. Retourne un dict, ou None si la mesure
+    échoue (ou silence).
+    """
+    cmd = [
+        "ffmpeg", "-hide_banner", "-nostats",
+        *trim_args,
+        "-i", path,
+        "-vn", "-sn", "-dn",
+        "-af", f"{loudnorm_targets()}:print_format=json",
+        "-f", "null", "-"
+    ]
+    try:
+        result = subprocess.run(cmd, capture_output=True, text=True, check=True,
+                                timeout=bounded_timeout(ANALYSIS_TIMEOUT_SECONDS, deadline))
+        report = parse_loudnorm_report(result.stderr)
+        integrated = float(report["input_i"])
+        true_peak = float(report["input_tp"])
+        measurement = {
+            "integrated_lufs": integrated,
+            "true_peak_dbtp": true_peak,
+            "lra": float(report["input_lra"]),
+            "threshold": float(report["input_thresh"]),
+            "target_offset": float(report["target_offset"]),
+        }
+    except (OSError, subprocess.CalledProcessError, subprocess.TimeoutExpired, ValueError, KeyError) as e:
+        print(f"  ⚠️ Mesure de sonie impossible pour {path}: {e}")
+        return None
+    if integrated == float("-inf"):
+        return None
+    return measurement
+
+def measure_async(path, trim_args=(), deadline=None):
+    """Lance la mesure en arrière-plan ; retourne un Future (résultat : dict ou None)."""
+    if not NORMALIZE_LOUDNESS:
+        future = Future()
+        future.set_result(None)
+        return future
+    return _executor.submit(measure_loudness, path, tuple(trim_args), deadline)
+
+def resolve(measurement):
+    """Accepte une mesure ou le Future renvoyé par measure_async ; retourne la mesure."""
+    if isinstance(measurement, Future):
+        return measurement.result()
+    return measurement
+
+def loudnorm_filter(measurement):
+    """
+    Filtre loudnorm qui amène le clip sur TARGET_LUFS à partir de mesures déjà faites :
+    gain linéaire si les crêtes le permettent, sinon loudnorm limite le true peak.
+    Retourne None si rien à appliquer.
+    """
+    measurement = resolve(measurement)
+    if not NORMALIZE_LOUDNESS or not measurement or "threshold" not in measurement:
+        return None  # mesures absentes ou d'un ancien format : pas de normalisation
+    return (
+        f"{loudnorm_targets()}:"
+        f"measured_I={measurement['integrated_lufs']}:measured_TP={measurement['true_peak_dbtp']}:"
+        f"measured_LRA={measurement['lra']}:measured_thresh={measurement['threshold']}:"
+        f"offset={measurement['target_offset']}:linear=true:print_format=none"
+    )
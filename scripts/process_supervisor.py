@@ -0,0 +1,152 @@
+import os
+import re
+import signal
+import time
+import threading
+import subprocess
+from collections import deque
+
+# --- Paramètres du superviseur (surchargeables par variables d'environnement) ---
+# Durée sans progrès (octets yt-dlp, frames ffmpeg) avant de tuer et relancer le processus
+STALL_TIMEOUT_SECONDS = float(os.getenv("STALL_TIMEOUT_SECONDS", "90"))
+# Budget total par clip (téléchargement + prétraitement + extraction), sans relance au-delà
+CLIP_WALL_BUDGET_SECONDS = float(os.getenv("CLIP_WALL_BUDGET_SECONDS", "900"))
+# Nombre de relances après un blocage
+MAX_STALL_RETRIES = int(os.getenv("MAX_STALL_RETRIES", "2"))
+# Timeout des appels courts sans sortie de progression (ffprobe)
+FFPROBE_TIMEOUT_SECONDS = 30
+
+OUTPUT_TAIL_LINES = 50
+POLL_INTERVAL_SECONDS = 0.5
+
+# Lignes de progression : "frame=123" / "out_time_us=..." (ffmpeg -progress)
+# et "[download]  42.0% of ..." ou "[download]   1.23MiB at ..." (yt-dlp --newline)
+FFMPEG_PROGRESS_RE = re.compile(r"^(frame|out_time_us|total_size)=(\S+)$")
+FFMPEG_PROGRESS_FIELD_RE = re.compile(r"^[a-z0-9_]+=\S*$")
+YTDLP_PROGRESS_RE = re.compile(r"^\[download\]\s+(\d[\d.]*\s*(?:%|[KMGT]?i?B))")
+
+class ProcessStalled(subprocess.TimeoutExpired):
+    """Processus tué faute de progrès ou parce qu'il a dépassé son budget de temps."""
+
+def with_progress(cmd):
+    """Ajoute à une commande ffmpeg / yt-dlp les options de progression lues par le superviseur."""
+    if cmd[0] == "ffmpeg" and "-progress" not in cmd:
+        return [cmd[0], "-progress", "pipe:1", "-nostats"] + cmd[1:]
+    if cmd[0] == "yt-dlp" and "--newline" not in cmd:
+        return [cmd[0], "--newline"] + cmd[1:]
+    return cmd
+
+def parse_progress(line):
+    """Retourne (clé, valeur) si la ligne est une ligne de progression, sinon None."""
+    m = FFMPEG_PROGRESS_RE.match(line)
+    if m:
+        return m.group(1), m.group(2)
+    m = YTDLP_PROGRESS_RE.match(line)
+    if m:
+        return "download", m.group(1)
+    return None
+
+def _kill(process):
+    """Tue le processus et ses enfants (yt-dlp lance ffmpeg pour la fusion)."""
+    if os.name == "posix":
+        try:
+            os.killpg(process.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+    else:
+        process.kill()
+    process.wait()
+
+def _watch(cmd, stall_timeout, deadline, echo):
+    """
+    Lance la commande et la surveille. Retourne (raison, code, dernières lignes)
+    où raison vaut None (terminé), "stall" ou "budget".
+    """
+    process = subprocess.Popen(
+        cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+        text=True, encoding="utf-8", errors="replace",
+        start_new_session=(os.name == "posix")
+    )
+    tail = deque(maxlen=OUTPUT_TAIL_LINES)
+    seen = {}
+    last_progress = [time.monotonic()]
+
+    def reader():
+        for raw_line in process.stdout:
+            line = raw_line.rstrip()
+            progress = parse_progress(line)
+            if progress:
+                key, value = progress
+                if seen.get(key) != value:
+                    seen[key] = value
+                    last_progress[0] = time.monotonic()
+                continue
+            if not seen:
+                # Avant la première ligne de progression (ouverture, extraction...), toute sortie compte
+                last_progress[0] = time.monotonic()
+            if FFMPEG_PROGRESS_FIELD_RE.match(line):
+                continue  # autres champs de -progress (fps, speed, progress=...)
+            tail.append(line)
+            if echo:
+                print(line, flush=True)
+
+    thread = threading.Thread(target=reader, daemon=True)
+    thread.start()
+
+    reason = None
+    try:
+        while process.poll() is None:
+            time.sleep(POLL_INTERVAL_SECONDS)
+            now = time.monotonic()
+            if deadline is not None and now > deadline:
+                reason = "budget"
+            elif now - last_progress[0] > stall_timeout:
+                reason = "stall"
+            if reason:
+                _kill(process)
+                break
+    except BaseException:
+        # Ctrl+C ou erreur : le processus est dans sa propre session, on le tue nous-mêmes
+        _kill(process)
+        raise
+
+    thread.join(timeout=5)
+    return reason, process.returncode, "\n".join(tail)
+
+def run_supervised(cmd, stall_timeout=STALL_TIMEOUT_SECONDS, deadline=None,
+                   retries=MAX_STALL_RETRIES, echo=False):
+    """
+    Exécute une commande en surveillant sa progression.
+    - aucun progrès pendant stall_timeout secondes : le processus est tué puis relancé
+    - deadline (time.monotonic()) dépassée : le processus est tué sans relance
+    Lève subprocess.CalledProcessError si la commande échoue, ProcessStalled si elle est abandonnée.
+    """
+    cmd = with_progress(cmd)
+    for attempt in range(1, retries + 2):
+        started = time.monotonic()
+        reason, returncode, output = _watch(cmd, stall_timeout, deadline, echo)
+        elapsed = time.monotonic() - started
+
+        if reason is None:
+            if returncode != 0:
+                raise subprocess.CalledProcessError(returncode, cmd, output=output)
+            return output
+
+        if reason == "budget":
+            print(f"  ⏱️ Budget de temps dépassé, processus tué après {elapsed:.0f}s : {cmd[0]}")
+            raise ProcessStalled(cmd, elapsed, output=output)
+
+        print(f"  ⚠️ Aucun progrès depuis {stall_timeout:.0f}s, processus tué "
+              f"(tentative {attempt}/{retries + 1}) : {cmd[0]}")
+
+    raise ProcessStalled(cmd, stall_timeout, output=output)
+
+def clip_deadline():
+    """Échéance absolue pour le traitement d'un clip."""
+    return time.monotonic() + CLIP_WALL_BUDGET_SECONDS
+
+def bounded_timeout(timeout, deadline=None):
+    """Timeout d'un appel court, réduit au temps restant avant deadline (None : pas d'échéance)."""
+    if deadline is None:
+        return timeout
+    return max(0.0, min(timeout, deadline - time.monotonic()))
@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+import os
+import sys
+import json
+import time
+import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+import disk_budget
+
+# --- Dossier des scripts (chaque étape est un script lancé en sous-processus) ---
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Nombre max d'étapes exécutées en parallèle
+MAX_PARALLEL_STAGES = int(os.getenv("PIPELINE_MAX_PARALLEL", "3"))
+# Force la ré-exécution même si les sorties sont à jour
+FORCE_ALL = os.getenv("PIPELINE_FORCE", "0") == "1"
+# Une étape sans entrée (appel à l'API Twitch) est considérée à jour tant que
+# ses sorties ont moins de cet âge : une reprise après échec ne re-télécharge rien
+SOURCE_MAX_AGE_HOURS = float(os.getenv("PIPELINE_SOURCE_MAX_AGE_HOURS", "24"))
+
+# --- Déclaration des étapes : script, entrées, sorties ---
+# Les dépendances sont déduites : une étape dépend de celles qui produisent ses entrées.
+# listed_files : JSON dont les fichiers listés ("path") doivent exister pour exécuter l'étape
+# always_run : sortie dépendante de la date, jamais considérée à jour
+STAGES = [
+    {
+        "name": "top_clips",
+        "script": "get_top_clips.py",
+        "inputs": [],
+        "outputs": [os.path.join("data", "top_clips.json"), os.path.join("data", "reserve_clips.json")],
+    },
+    {
+        "name": "download",
+        "script": "download_clips.py",
+        "inputs": [os.path.join("data", "top_clips.json"), os.path.join("data", "reserve_clips.json")],
+        "outputs": [os.path.join("data", "downloaded_clip_paths.json")],
+    },
+    {
+        "name": "compile",
+        "script": "compile_video.py",
+        "inputs": [
+            os.path.join("data", "downloaded_clip_paths.json"),
+            os.path.join("assets", "intro.mp4"),
+            os.path.join("assets", "outro.mp4"),
+        ],
+        "outputs": [os.path.join("output", "compiled_video.mp4")],
+        "listed_files": [os.path.join("data", "downloaded_clip_paths.json")],
+    },
+    {
+        "name": "metadata",
+        "script": "generate_metadata.py",
+        "inputs": [os.path.join("data", "downloaded_clip_paths.json")],
+        "outputs": [os.path.join("data", "video_metadata.json")],
+    },
+    {
+        "name": "thumbnail",
+        "script": "generate_thumbnail.py",
+        "inputs": [os.path.join("assets", "miniature.png")],
+        "outputs": [os.path.join("data", "thumbnail.jpg")],
+        "always_run": True,  # le mois courant est dessiné sur l'image (étape rapide)
+    },
+]
+
+_print_lock = threading.Lock()
+
+def log(message):
+    with _print_lock:
+        print(message, flush=True)
+
+def build_dependencies(stages):
+    """Associe à chaque étape la liste des étapes qui produisent ses entrées."""
+    producers = {}
+    for stage in stages:
+        for path in stage["outputs"]:
+            producers[path] = stage["name"]
+    deps = {}
+    for stage in stages:
+        deps[stage["name"]] = sorted({producers[p] for p in stage["inputs"] if p in producers})
+    return deps
+
+def missing_listed_files(json_path):
+    """Fichiers listés dans json_path (clé "path") qui n'existent plus."""
+    try:
+        with open(json_path, "r", encoding="utf-8") as f:
+            entries = json.load(f)
+    except (OSError, ValueError):
+        return [json_path]
+    return [e["path"] for e in entries if e.get("path") and not os.path.exists(e["path"])]
+
+def is_up_to_date(stage):
+    """
+    Une étape est à jour si toutes ses sorties existent et sont plus récentes
+    que toutes ses entrées. Une étape sans entrée est à jour si ses sorties
+    ont moins de SOURCE_MAX_AGE_HOURS.
+    Une étape qui produit un JSON de fichiers (listed_files d'une étape suivante)
+    n'est pas à jour si cette étape doit tourner et que des fichiers listés manquent
+    (supprimés en mode budget disque, par exemple).
+    """
+    if FORCE_ALL or stage.get("always_run") or not stage["outputs"]:
+        return False
+    if not all(os.path.exists(p) for p in stage["outputs"] + stage["inputs"]):
+        return False
+    oldest_output = min(os.path.getmtime(p) for p in stage["outputs"])
+    if not stage["inputs"]:
+        return time.time() - oldest_output < SOURCE_MAX_AGE_HOURS * 3600
+    newest_input = max(os.path.getmtime(p) for p in stage["inputs"])
+    if oldest_output < newest_input:
+        return False
+    for consumer in STAGES:
+        for json_path in consumer.get("listed_files", []):
+            if json_path in stage["outputs"] and not is_up_to_date(consumer):
+                missing = missing_listed_files(json_path)
+                if missing:
+                    log(f"♻️ Étape '{stage['name']}' relancée : {len(missing)} fichier(s) de {json_path} "
+                        f"manquant(s) pour '{consumer['name']}'.")
+                    return False
+    return True
+
+def run_stage(stage):
+    """Lance le script de l'étape en préfixant chaque ligne de sortie par son nom."""
+    cmd = [sys.executable, os.path.join(SCRIPTS_DIR, stage["script"])]
+    env = dict(os.environ, PYTHONUNBUFFERED="1")
+    prefix = f"[{stage['name']}]"
+    process = subprocess.Popen(
+        cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+        text=True, encoding="utf-8", errors="replace", env=env
+    )
+    for line in process.stdout:
+        log(f"{prefix} {line.rstrip()}")
+    return process.wait()
+
+def print_timing_report(stages, deps, results, wall_clock):
+    """Affiche la durée de chaque étape et le chemin critique du graphe."""
+    # Fin "au plus tôt" de chaque étape si seules les dépendances imposaient un ordre
+    finish = {}
+    critical_parent = {}
+    for stage in stages:  # STAGES est déjà dans un ordre topologique
+        name = stage["name"]
+        parent = max(deps[name], key=lambda d: finish.get(d, 0.0), default=None)
+        start = finish.get(parent, 0.0) if parent else 0.0
+        finish[name] = start + results.get(name, {}).get("duration", 0.0)
+        critical_parent[name] = parent
+
+    last = max(finish, key=finish.get)
+    path = []
+    while last:
+        path.append(last)
+        last = critical_parent[last]
+    path.reverse()
+
+    log("\n⏱️ Rapport de temps du pipeline :")
+    for stage in stages:
+        name = stage["name"]
+        res = results.get(name, {"status": "non lancée", "duration": 0.0, "start": 0.0})
+        marker = "★" if name in path else " "
+        log(f"  {marker} {name:<10} {res['status']:<10} début +{res['start']:6.1f}s  durée {res['duration']:7.1f}s")
+    log(f"  Chemin critique : {' → '.join(path)} ({finish[path[-1]]:.1f}s)")
+    log(f"  Temps total (mur) : {wall_clock:.1f}s")
+
+def run_pipeline():
+    print("🚦 Démarrage du pipeline (étapes indépendantes en parallèle)...")
+    deps = build_dependencies(STAGES)
+    by_name = {s["name"]: s for s in STAGES}
+    pending = [s["name"] for s in STAGES]
+    running = {}
+    results = {}
+    failed = set()
+    disk_budget.reset_usage()
+    t0 = time.monotonic()
+
+    with ThreadPoolExecutor(max_workers=MAX_PARALLEL_STAGES) as pool:
+        while pending or running:
+            # Abandonner les étapes dont une dépendance a échoué
+            for name in list(pending):
+                if any(d in failed for d in deps[name]):
+                    pending.remove(name)
+                    failed.add(name)
+                    results[name] = {"status": "annulée", "duration": 0.0, "start": time.monotonic() - t0}
+                    log(f"⏭️ Étape '{name}' annulée (dépendance en échec).")
+
+            # Lancer toutes les étapes prêtes
+            for name in list(pending):
+                if not all(d in results and d not in failed for d in deps[name]):
+                    continue
+                pending.remove(name)
+                stage = by_name[name]
+                start = time.monotonic() - t0
+                if is_up_to_date(stage):
+                    results[name] = {"status": "à jour", "duration": 0.0, "start": start}
+                    log(f"⏭️ Étape '{name}' ignorée : sorties déjà à jour.")
+                    continue
+                log(f"▶ Étape '{name}' lancée ({stage['script']}).")
+                running[pool.submit(run_stage, stage)] = (name, start)
+
+            if not running:
+                continue
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name, start = running.pop(future)
+                duration = time.monotonic() - t0 - start
+                try:
+                    returncode = future.result()
+                except Exception as e:
+                    log(f"❌ Étape '{name}' : erreur inattendue : {e}")
+                    returncode = -1
+                if returncode == 0:
+                    results[name] = {"status": "ok", "duration": duration, "start": start}
+                    log(f"✅ Étape '{name}' terminée en {duration:.1f}s.")
+                else:
+                    failed.add(name)
+                    results[name] = {"status": "échec", "duration": duration, "start": start}
+                    log(f"❌ Étape '{name}' en échec (code {returncode}).")
+
+    print_timing_report(STAGES, deps, results, time.monotonic() - t0)
+    disk_budget.print_usage_report()
+
+    if failed:
+        print(f"❌ Pipeline terminé avec des erreurs : {', '.join(sorted(failed))}")
+        sys.exit(1)
+    print("✅ Pipeline terminé.")
+
+if __name__ == "__main__":
+    run_pipeline()